@@ -4,10 +4,17 @@ Git Auto-Sync - Sync Engine
 Handles actual git operations for multiple repositories
 """
 
+import asyncio
+import atexit
+import contextvars
+import fcntl
+import functools
 import json
 import os
+import shutil
 import sys
 import subprocess
+import threading
 import time
 from datetime import datetime
 from pathlib import Path
@@ -23,106 +30,312 @@ LOCK_FILE = LOG_DIR / "lock.pid"
 # Ensure log directory exists
 LOG_DIR.mkdir(parents=True, exist_ok=True)
 
+# Open once, line-buffered; syncs run in parallel so writes take a lock
+_LOG_FH = open(LOG_FILE, "a", buffering=1)
+os.set_inheritable(_LOG_FH.fileno(), False)
+_log_lock = threading.Lock()
+atexit.register(_LOG_FH.close)
+
+# Log timestamps have second granularity, so reuse the formatted string
+# within the same second instead of re-running strftime per line
+_last_ts = (0, "")
+
+def _timestamp():
+    global _last_ts
+    now = int(time.time())
+    if now != _last_ts[0]:
+        _last_ts = (now, time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now)))
+    return _last_ts[1]
+
+# When set (one list per sync task), log lines accumulate and hit the file
+# as a single writev at sync end instead of one write syscall per line
+_log_buffer = contextvars.ContextVar("log_buffer", default=None)
+
 def log(message, level="INFO"):
     """Write to log file"""
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    timestamp = _timestamp()
     log_line = f"{timestamp} | {level} | {message}\n"
-    
-    with open(LOG_FILE, "a") as f:
-        f.write(log_line)
-    
+
+    buf = _log_buffer.get()
+    if buf is not None:
+        buf.append(log_line)
+    else:
+        with _log_lock:
+            _LOG_FH.write(log_line)
+
     # Also print if in head mode
     if "--head" in sys.argv:
         print(f"[{timestamp}] {level}: {message}")
 
+def flush_log_buffer():
+    """Write a sync's buffered log lines in one batched syscall"""
+    buf = _log_buffer.get()
+    if not buf:
+        return
+    with _log_lock:
+        _LOG_FH.flush()
+        os.writev(_LOG_FH.fileno(), [line.encode() for line in buf])
+    buf.clear()
+
+@functools.lru_cache(maxsize=1)
 def get_config():
-    """Load configuration"""
-    if not CONFIG_FILE.exists():
+    """Load configuration (parsed once per process)"""
+    try:
+        with open(CONFIG_FILE) as f:
+            return json.load(f)
+    except FileNotFoundError:
         return {"repos": [], "global": {}}
-    
-    with open(CONFIG_FILE) as f:
-        return json.load(f)
+
+def load_status():
+    """Read the per-repo status file written by save_status"""
+    try:
+        with open(STATUS_FILE) as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except (FileNotFoundError, ValueError):
+        return {}
+
+_status_lock = threading.Lock()
 
 def save_status(repo_path, status, message="", branch="main", remote="origin"):
-    """Save last sync status"""
-    status_data = {
-        "repo": repo_path,
+    """Save last sync status, keyed per repo and atomically replaced"""
+    entry = {
         "branch": branch,
         "remote": remote,
         "status": status,
         "message": message,
         "timestamp": datetime.now().isoformat()
     }
-    
-    with open(STATUS_FILE, "w") as f:
-        json.dump(status_data, f, indent=2)
 
-def acquire_lock():
-    """Acquire sync lock"""
-    if LOCK_FILE.exists():
+    with _status_lock:
         try:
-            pid = int(LOCK_FILE.read_text().strip())
-            # Check if process is still running
-            os.kill(pid, 0)
-            log(f"Another sync is running (PID: {pid})", "ERROR")
-            return False
-        except (ProcessLookupError, ValueError):
-            # Process dead, remove stale lock
-            LOCK_FILE.unlink()
-    
-    LOCK_FILE.write_text(str(os.getpid()))
+            with open(STATUS_FILE) as f:
+                status_data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            status_data = {}
+        if not isinstance(status_data, dict) or "repo" in status_data:
+            # Old single-repo schema; start fresh
+            status_data = {}
+
+        status_data[str(repo_path)] = entry
+
+        # Write-then-rename so readers never see a half-written file
+        tmp = STATUS_FILE.with_name(f"{STATUS_FILE.name}.{os.getpid()}.tmp")
+        with open(tmp, "w") as f:
+            json.dump(status_data, f, separators=(",", ":"))
+        os.replace(tmp, STATUS_FILE)
+
+# Held open for the lifetime of main() while we own the lock
+_lock_fd = None
+
+def _proc_starttime(pid):
+    """Read a process's start time (field 22 of /proc/<pid>/stat)"""
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            stat = f.read()
+        # comm (field 2) may contain spaces; parse after its closing paren
+        return int(stat.rsplit(b")", 1)[1].split()[19])
+    except (OSError, ValueError, IndexError):
+        return None
+
+def acquire_lock():
+    """Acquire sync lock via exclusive flock (no stale-PID races)"""
+    global _lock_fd
+    fd = os.open(LOCK_FILE, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        # Lock held by a live process; the recorded pid+starttime lets us
+        # tell a genuine holder from a reused PID when diagnosing
+        content = os.read(fd, 64).decode("utf-8", "replace").split()
+        os.close(fd)
+        holder = content[0] if content else "unknown"
+        recorded = int(content[1]) if len(content) > 1 and content[1].isdigit() else None
+        if recorded is not None and _proc_starttime(holder) != recorded:
+            log(f"Another sync is running (lock file PID {holder} is stale/reused)", "ERROR")
+        else:
+            log(f"Another sync is running (PID: {holder})", "ERROR")
+        return False
+
+    os.ftruncate(fd, 0)
+    os.write(fd, f"{os.getpid()} {_proc_starttime(os.getpid()) or 0}\n".encode())
+    _lock_fd = fd
     return True
 
 def release_lock():
     """Release sync lock"""
-    if LOCK_FILE.exists():
-        LOCK_FILE.unlink()
+    global _lock_fd
+    if _lock_fd is not None:
+        fcntl.flock(_lock_fd, fcntl.LOCK_UN)
+        os.close(_lock_fd)
+        _lock_fd = None
 
 def should_skip_sync():
     """Always sync - no quiet hours"""
     return False  # Never skip
 
-def has_changes(repo_path):
+# Resolve the git binary once instead of a PATH search per spawn
+_GIT = shutil.which("git") or "git"
+
+# Never let a headless git invocation hang on a credentials prompt
+_GIT_ENV = {**os.environ, "GIT_TERMINAL_PROMPT": "0"}
+
+# Environment for read-only git probes: skip optional index-lock taking so
+# parallel status/rev-list reads never contend on .git/index.lock
+_GIT_RO_ENV = {**_GIT_ENV, "GIT_OPTIONAL_LOCKS": "0"}
+
+async def run_git(args, repo_path, env=_GIT_ENV, timeout=None):
+    """Run a git command without blocking the event loop"""
+    proc = await asyncio.create_subprocess_exec(
+        *args,
+        cwd=repo_path,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        env=env,
+        close_fds=False
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        raise
+    return subprocess.CompletedProcess(args, proc.returncode, stdout, stderr)
+
+# Cap concurrent network operations per remote host: dozens of parallel
+# fetches against one server just trigger rate limiting and retransmits
+_HOST_CONCURRENCY = 4
+_host_sems = {}
+_remote_hosts = {}
+
+def _url_host(url):
+    """Extract the hostname from an https/ssh/scp-style git URL"""
+    if "://" in url:
+        host = url.split("://", 1)[1].split("/", 1)[0]
+    elif ":" in url and "/" not in url.split(":", 1)[0]:
+        # scp-like user@host:path
+        host = url.split(":", 1)[0]
+    else:
+        return "local"
+    return host.rsplit("@", 1)[-1].split(":", 1)[0] or "local"
+
+async def remote_host(repo_path, remote="origin"):
+    """Resolve (and cache) the hostname a remote points at"""
+    key = (str(repo_path), remote)
+    host = _remote_hosts.get(key)
+    if host is None:
+        result = await run_git(
+            [_GIT, "remote", "get-url", remote],
+            repo_path,
+            env=_GIT_RO_ENV
+        )
+        host = _url_host(result.stdout.decode("utf-8", "replace").strip())
+        _remote_hosts[key] = host
+    return host
+
+def host_semaphore(host):
+    """One semaphore per remote host, shared by all repos"""
+    sem = _host_sems.get(host)
+    if sem is None:
+        sem = _host_sems.setdefault(host, asyncio.Semaphore(_HOST_CONCURRENCY))
+    return sem
+
+# Repos whose fsmonitor config has been checked this process
+_fsmonitor_checked = set()
+
+async def enable_fsmonitor(repo_path):
+    """Enable git's filesystem monitor so status scans scale with changed
+    files instead of working-tree size (idempotent, once per repo)"""
+    key = str(repo_path)
+    if key in _fsmonitor_checked:
+        return
+    _fsmonitor_checked.add(key)
+
+    result = await run_git(
+        [_GIT, "config", "--get", "core.fsmonitor"],
+        repo_path,
+        env=_GIT_RO_ENV
+    )
+    if result.returncode == 0:
+        # Key already set (maybe to a watchman hook or an explicit false);
+        # leave deliberate user config alone
+        return
+
+    for name, value in (("core.fsmonitor", "true"), ("core.untrackedCache", "true")):
+        await run_git([_GIT, "config", name, value], repo_path)
+
+# Ahead/behind counts cached per repo so git_push can reuse git_pull's query
+_ahead_behind = {}
+
+async def count_ahead_behind(repo_path, remote="origin", branch="main"):
+    """Run a single rev-list query for both ahead and behind counts"""
+    result = await run_git(
+        [_GIT, "rev-list", "--left-right", "--count", f"HEAD...{remote}/{branch}"],
+        repo_path,
+        env=_GIT_RO_ENV
+    )
+    try:
+        ahead, behind = (int(n) for n in result.stdout.split())
+    except ValueError:
+        ahead, behind = 0, 0
+    _ahead_behind[str(repo_path)] = (ahead, behind)
+    return ahead, behind
+
+async def has_changes(repo_path):
     """Check if repo has uncommitted changes"""
     try:
-        result = subprocess.run(
-            ["git", "status", "--porcelain"],
-            cwd=repo_path,
-            capture_output=True,
-            text=True
+        result = await run_git(
+            [_GIT, "status", "-z", "--porcelain"],
+            repo_path,
+            env=_GIT_RO_ENV
         )
-        return bool(result.stdout.strip())
+        return bool(result.stdout)
     except Exception as e:
         log(f"Error checking changes in {repo_path}: {e}", "ERROR")
         return False
 
-def git_pull(repo_path, strategy="ours", remote="origin", branch="main"):
+def fetch_is_fresh(repo_path, min_fetch_interval):
+    """Check whether the last fetch is recent enough to skip this one"""
+    if min_fetch_interval <= 0:
+        return False
+    try:
+        age = time.time() - (repo_path / ".git" / "FETCH_HEAD").stat().st_mtime
+    except OSError:
+        return False
+    if age >= min_fetch_interval:
+        return False
+    # Only trust a recent fetch if the last sync actually completed
+    return load_status().get(str(repo_path), {}).get("status") == "success"
+
+async def git_pull(repo_path, strategy="ours", remote="origin", branch="main", jobs=8,
+                   min_fetch_interval=30):
     """Pull changes from remote"""
     log(f"Pulling {repo_path} ({remote}/{branch}, strategy: {strategy})")
-    
+
+    # Let git parallelize multi-remote/submodule fetches itself
+    fetch_opts = [f"--jobs={jobs}"]
+    if (repo_path / ".gitmodules").exists():
+        fetch_opts.append("--recurse-submodules=on-demand")
+
     try:
-        # Fetch first
-        result = subprocess.run(
-            ["git", "fetch", remote],
-            cwd=repo_path,
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
-        
-        if result.returncode != 0:
-            log(f"Fetch failed: {result.stderr}", "ERROR")
-            return False
-        
-        # Check if behind
-        result = subprocess.run(
-            ["git", "rev-list", "--count", f"HEAD..{remote}/{branch}"],
-            cwd=repo_path,
-            capture_output=True,
-            text=True
-        )
-        behind = int(result.stdout.strip()) if result.stdout.strip() else 0
-        
+        # Fetch first, unless the previous fetch was moments ago
+        if fetch_is_fresh(repo_path, min_fetch_interval):
+            log(f"Fetched <{min_fetch_interval}s ago, skipping fetch")
+        else:
+            async with host_semaphore(await remote_host(repo_path, remote)):
+                result = await run_git(
+                    [_GIT, "fetch"] + fetch_opts + [remote],
+                    repo_path,
+                    timeout=30
+                )
+
+            if result.returncode != 0:
+                log(f"Fetch failed: {result.stderr.decode('utf-8', 'replace')}", "ERROR")
+                return False
+
+        # Check if behind (also caches ahead count for git_push)
+        _, behind = await count_ahead_behind(repo_path, remote, branch)
+
         if behind == 0:
             log("Already up-to-date")
             return True
@@ -130,54 +343,58 @@ def git_pull(repo_path, strategy="ours", remote="origin", branch="main"):
         log(f"Behind by {behind} commit(s), pulling...")
         
         # Pull with conflict strategy
-        result = subprocess.run(
-            ["git", "pull", "-X", strategy, remote, branch],
-            cwd=repo_path,
-            capture_output=True,
-            text=True,
-            timeout=60
-        )
-        
+        async with host_semaphore(await remote_host(repo_path, remote)):
+            result = await run_git(
+                [_GIT, "pull", f"-j{jobs}", "-X", strategy, remote, branch],
+                repo_path,
+                timeout=60
+            )
+
         if result.returncode == 0:
             log(f"Pull completed ({behind} commits)", "SUCCESS")
             return True
         else:
-            log(f"Pull failed: {result.stderr}", "ERROR")
-            # Try to abort merge
-            subprocess.run(["git", "merge", "--abort"], cwd=repo_path, capture_output=True)
+            log(f"Pull failed: {result.stderr.decode('utf-8', 'replace')}", "ERROR")
+            # Abort only if a merge is actually in flight (one stat vs a fork)
+            if (repo_path / ".git" / "MERGE_HEAD").exists():
+                await run_git([_GIT, "merge", "--abort"], repo_path)
             return False
-            
-    except subprocess.TimeoutExpired:
+
+    except asyncio.TimeoutError:
         log("Pull timed out", "ERROR")
         return False
     except Exception as e:
         log(f"Pull error: {e}", "ERROR")
         return False
 
-def git_commit(repo_path):
+async def git_commit(repo_path):
     """Commit changes if any"""
-    if not has_changes(repo_path):
-        log("No changes to commit")
-        return True
-    
     try:
+        # Cheap read-only probe first: if the only changes are under logs/,
+        # skip the index-rewriting git add entirely
+        result = await run_git(
+            [_GIT, "status", "--porcelain=v2", "-z", "--", ".", ":(exclude)logs/"],
+            repo_path,
+            env=_GIT_RO_ENV
+        )
+        if not result.stdout:
+            log("No changes to commit (only excluded paths)")
+            return True
+
         # Add all changes (excluding logs/)
-        result = subprocess.run(
-            ["git", "add", "-A", "--", ":(exclude)logs/"],
-            cwd=repo_path,
-            capture_output=True,
-            text=True,
+        result = await run_git(
+            [_GIT, "add", "-A", "--", ":(exclude)logs/"],
+            repo_path,
             timeout=30
         )
-        
-        # Count changed files
-        result = subprocess.run(
-            ["git", "diff", "--cached", "--name-only"],
-            cwd=repo_path,
-            capture_output=True,
-            text=True
+
+        # Count changed files (-z avoids quoting of paths with spaces)
+        result = await run_git(
+            [_GIT, "diff", "--cached", "--name-only", "-z"],
+            repo_path,
+            env=_GIT_RO_ENV
         )
-        changed = len([l for l in result.stdout.split('\n') if l.strip()])
+        changed = result.stdout.count(b'\x00')
         
         if changed == 0:
             log("No changes to commit after add")
@@ -185,39 +402,34 @@ def git_commit(repo_path):
         
         # Commit
         message = f"Auto-sync: {changed} file(s) updated - {datetime.now().strftime('%Y-%m-%d %H:%M')}"
-        result = subprocess.run(
-            ["git", "commit", "-m", message],
-            cwd=repo_path,
-            capture_output=True,
-            text=True,
+        result = await run_git(
+            [_GIT, "commit", "-m", message],
+            repo_path,
             timeout=30
         )
         
         if result.returncode == 0:
+            # Cached ahead/behind counts are stale once a new commit exists
+            _ahead_behind.pop(str(repo_path), None)
             log(f"Committed {changed} file(s)", "SUCCESS")
             return True
         else:
-            log(f"Commit failed: {result.stderr}", "ERROR")
+            log(f"Commit failed: {result.stderr.decode('utf-8', 'replace')}", "ERROR")
             return False
             
     except Exception as e:
         log(f"Commit error: {e}", "ERROR")
         return False
 
-def git_push(repo_path, remote="origin", branch="main"):
+async def git_push(repo_path, remote="origin", branch="main"):
     """Push changes to remote"""
     log(f"Pushing {repo_path} ({remote}/{branch})")
     
     try:
-        # Check if ahead
-        result = subprocess.run(
-            ["git", "rev-list", "--count", f"{remote}/{branch}..HEAD"],
-            cwd=repo_path,
-            capture_output=True,
-            text=True
-        )
-        ahead = int(result.stdout.strip()) if result.stdout.strip() else 0
-        
+        # Check if ahead, reusing git_pull's rev-list result when available
+        cached = _ahead_behind.pop(str(repo_path), None)
+        ahead = cached[0] if cached else (await count_ahead_behind(repo_path, remote, branch))[0]
+
         if ahead == 0:
             log("No new commits to push")
             return True
@@ -225,34 +437,43 @@ def git_push(repo_path, remote="origin", branch="main"):
         log(f"Ahead by {ahead} commit(s), pushing...")
         
         # Push with force-if-includes (safer than --force)
-        result = subprocess.run(
-            ["git", "push", "--force-if-includes", remote, branch],
-            cwd=repo_path,
-            capture_output=True,
-            text=True,
-            timeout=60
-        )
-        
+        async with host_semaphore(await remote_host(repo_path, remote)):
+            result = await run_git(
+                [_GIT, "push", "--force-if-includes", remote, branch],
+                repo_path,
+                timeout=60
+            )
+
         if result.returncode == 0:
             log(f"Push completed ({ahead} commits)", "SUCCESS")
             return True
         else:
-            log(f"Push failed: {result.stderr}", "ERROR")
+            log(f"Push failed: {result.stderr.decode('utf-8', 'replace')}", "ERROR")
             return False
-            
-    except subprocess.TimeoutExpired:
+
+    except asyncio.TimeoutError:
         log("Push timed out", "ERROR")
         return False
     except Exception as e:
         log(f"Push error: {e}", "ERROR")
         return False
 
-def sync_repo(repo_config, dry_run=False, force=False):
+async def sync_repo(repo_config, dry_run=False, force=False):
+    """Sync a single repository, batching its log output"""
+    _log_buffer.set([])
+    try:
+        return await _sync_repo(repo_config, dry_run, force)
+    finally:
+        flush_log_buffer()
+
+async def _sync_repo(repo_config, dry_run, force):
     """Sync a single repository"""
     repo_path = Path(repo_config["path"])
     strategy = repo_config.get("strategy", "ours")
     branch = repo_config.get("branch", "main")
     remote = repo_config.get("remote", "origin")
+    jobs = repo_config.get("jobs", 8)
+    min_fetch_interval = repo_config.get("minFetchInterval", 30)
     
     if not repo_path.exists():
         log(f"Repository not found: {repo_path}", "ERROR")
@@ -264,27 +485,28 @@ def sync_repo(repo_config, dry_run=False, force=False):
     
     log(f"=== Syncing: {repo_path} ===")
     log(f"Branch: {branch} | Remote: {remote} | Strategy: {strategy}")
-    
+
     if dry_run:
         log("DRY RUN - no changes will be made")
         return True
+
+    await enable_fsmonitor(repo_path)
     
     # Pull
-    if not git_pull(repo_path, strategy, remote, branch):
+    if not await git_pull(repo_path, strategy, remote, branch, jobs, min_fetch_interval):
         save_status(str(repo_path), "failed", "Pull failed", branch, remote)
         return False
-    
-    time.sleep(2)
-    
-    # Commit
-    if not git_commit(repo_path):
-        save_status(str(repo_path), "failed", "Commit failed", branch, remote)
-        return False
-    
-    time.sleep(2)
-    
+
+    # Commit (skip entirely when the working tree is clean)
+    if await has_changes(repo_path):
+        if not await git_commit(repo_path):
+            save_status(str(repo_path), "failed", "Commit failed", branch, remote)
+            return False
+    else:
+        log("No changes to commit")
+
     # Push
-    if not git_push(repo_path, remote, branch):
+    if not await git_push(repo_path, remote, branch):
         save_status(str(repo_path), "failed", "Push failed", branch, remote)
         return False
     
@@ -292,6 +514,10 @@ def sync_repo(repo_config, dry_run=False, force=False):
     log(f"=== Sync completed: {repo_path} ===")
     return True
 
+async def sync_all(repos, dry_run, force):
+    """Sync all repos concurrently on one event loop"""
+    return await asyncio.gather(*(sync_repo(r, dry_run, force) for r in repos))
+
 def main():
     """Main sync logic"""
     import argparse
@@ -325,15 +551,18 @@ def main():
         # No quiet hours - always sync
         # (should_skip_sync always returns False)
         
-        # Sync each repo
-        success_count = 0
+        # Fan all enabled repos out onto one asyncio event loop
+        enabled = []
         for repo in repos:
             if not repo.get("enabled", True):
                 log(f"Skipping disabled repo: {repo['path']}")
                 continue
-            
-            if sync_repo(repo, dry_run=args.dry_run, force=args.force):
-                success_count += 1
+            enabled.append(repo)
+
+        success_count = 0
+        if enabled:
+            results = asyncio.run(sync_all(enabled, args.dry_run, args.force))
+            success_count = sum(1 for ok in results if ok)
         
         log(f"Sync completed: {success_count}/{len(repos)} repos successful")
         